@@ -1,13 +1,18 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, abort, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, flash, session, abort, send_from_directory, send_file
 from flask_wtf.csrf import CSRFProtect
 from flask_login import LoginManager, current_user, login_user, logout_user, login_required
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
 from werkzeug.utils import secure_filename
 from functools import wraps
+import gzip
+import io
+import json
 import logging
+import mimetypes
 import os
 from forms import LoginForm, RegisterForm, ReceiptForm, CategoryForm, TagForm, PaymentMethodForm, VendorForm, DateRangeForm
 import models
+import duplicates
 from models import User, get_vendors, create_vendor
 from config import Config
 
@@ -33,6 +38,43 @@ except Exception as e:
     logger.error(f"Error initializing database connection: {e}")
     raise
 
+# Fingerprinted assets written by build_assets.py
+ASSET_FOLDER = os.path.join(app.static_folder, 'dist')
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+try:
+    with open(os.path.join(ASSET_FOLDER, 'manifest.json'), encoding='utf-8') as f:
+        asset_manifest = json.load(f)
+except FileNotFoundError:
+    logger.warning("No asset manifest found, run build_assets.py to bundle static assets")
+    asset_manifest = {}
+
+def asset_url_for(endpoint, **values):
+    # Rewrites static URLs of built assets to their fingerprinted versions
+    if endpoint == 'static' and values.get('filename') in asset_manifest:
+        return url_for('asset', filename=asset_manifest[values.pop('filename')], **values)
+    return url_for(endpoint, **values)
+
+@app.context_processor
+def inject_asset_url_for():
+    return dict(url_for=asset_url_for, asset_manifest=asset_manifest)
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    # Serves the precompressed variant the client accepts. The file names
+    # change with their content, so they can be cached forever.
+    mimetype = mimetypes.guess_type(filename)[0]
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        compressed = safe_join(ASSET_FOLDER, filename + suffix)
+        if request.accept_encodings[encoding] and compressed and os.path.exists(compressed):
+            response = send_from_directory(ASSET_FOLDER, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(ASSET_FOLDER, filename, mimetype=mimetype)
+    response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    response.vary.add('Accept-Encoding')
+    return response
+
 @login_manager.user_loader
 def load_user(user_id):
     return models.get_user_by_id(int(user_id))
@@ -109,7 +151,17 @@ def profile():
 @app.route('/uploads/<filename>')
 @login_required
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    uploaded = safe_join(app.config['UPLOAD_FOLDER'], filename)
+    if uploaded and os.path.exists(uploaded):
+        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # Files of archived receipts live gzipped in the archive folder
+    archived = safe_join(app.config['ARCHIVE_FOLDER'], filename + '.gz')
+    if archived and os.path.exists(archived):
+        with gzip.open(archived, 'rb') as f:
+            data = f.read()
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        return send_file(io.BytesIO(data), mimetype=mimetype, download_name=filename)
+    abort(404)
 
 @app.route('/upload', methods=['GET', 'POST'])
 @login_required
@@ -120,11 +172,28 @@ def upload():
     form.tags.choices = [(t['id'], t['name']) for t in models.get_tags()]
     form.vendor.choices = [(v['id'], v['name']) for v in models.get_vendors()]
 
+    duplicate_receipts = None
     if form.validate_on_submit():
         try:
-            filename = secure_filename(form.file.data.filename)
+            content_hash = duplicates.file_hash(form.file.data.stream)
+            image_hash = duplicates.image_hash(form.file.data.stream)
+            found = duplicates.find_duplicates(
+                current_user.id, content_hash, image_hash,
+                form.amount.data, form.receipt_date.data, form.vendor.data
+            )
+            if found and not form.allow_duplicate.data:
+                duplicate_receipts = found
+                flash('This receipt looks like one you have already uploaded.', 'warning')
+                logger.info(f"Possible duplicate upload by user_id: {current_user.id}: {found}")
+                return render_template('upload.html', form=form, duplicate_receipts=duplicate_receipts)
+
+            # Files are stored under their content hash, so a name always means
+            # one content and identical uploads share the stored file
+            extension = os.path.splitext(secure_filename(form.file.data.filename))[1].lower()
+            filename = f"{content_hash}{extension}"
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            form.file.data.save(filepath)
+            if not os.path.exists(filepath):
+                form.file.data.save(filepath)
             
             receipt_id = models.create_receipt(
                 filename, 
@@ -134,10 +203,14 @@ def upload():
                 current_user.id, 
                 form.category.data,
                 form.vendor.data, 
-                form.payment_method.data
+                form.payment_method.data,
+                content_hash,
+                image_hash,
+                bool(found)
             )
             
             if receipt_id:
+                duplicates.add_to_image_index(current_user.id, receipt_id, image_hash)
                 models.add_receipt_tags(receipt_id, form.tags.data)
                 flash('Receipt uploaded successfully!', 'success')
                 return redirect(url_for('index'))
@@ -149,7 +222,7 @@ def upload():
     else:
         app.logger.warning(f"Form validation failed: {form.errors}")
     
-    return render_template('upload.html', form=form)
+    return render_template('upload.html', form=form, duplicate_receipts=duplicate_receipts)
 
 @app.route('/view_receipt/<int:receipt_id>')
 @login_required
@@ -197,6 +270,7 @@ def delete_receipt(receipt_id):
     receipt = models.get_receipt_by_id(receipt_id)
     if receipt and receipt['user_id'] == current_user.id:
         if models.delete_receipt(receipt_id):
+            duplicates.remove_from_image_index(current_user.id, receipt_id)
             flash('Receipt deleted successfully.', 'success')
             logger.info(f"Receipt {receipt_id} deleted successfully by user_id: {current_user.id}")
         else:
@@ -0,0 +1,88 @@
+import argparse
+import datetime
+import gzip
+import hashlib
+import logging
+import os
+import re
+import shutil
+import psycopg2
+import models
+from config import Config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PARTITION_YEAR = re.compile(r'^receipts_y(\d{4})$')
+
+def file_digest(f):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(64 * 1024), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+# Gzip an uploaded file into the archive folder and remove the original.
+# New uploads are named by their content hash, but legacy filenames are not
+# unique, so an existing archive with different content is never replaced.
+def archive_file(filename):
+    source = os.path.join(Config.UPLOAD_FOLDER, filename)
+    target = os.path.join(Config.ARCHIVE_FOLDER, filename + '.gz')
+    if not os.path.exists(source):
+        return False
+    if os.path.exists(target):
+        with open(source, 'rb') as src, gzip.open(target, 'rb') as archived:
+            same_content = file_digest(src) == file_digest(archived)
+        if not same_content:
+            logger.error(f"Not archiving {filename}: {target} already holds a different file")
+            return False
+    else:
+        with open(source, 'rb') as src, gzip.open(target + '.tmp', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(target + '.tmp', target)
+    os.remove(source)
+    return True
+
+def archive_year(year, tablespace):
+    if tablespace:
+        models.move_receipt_partitions_to_tablespace(year, tablespace)
+    archived = sum(archive_file(filename) for filename in models.get_receipt_filenames_for_year(year))
+    logger.info(f"Archived {archived} receipt files for {year}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old receipt partitions and files to cold storage. "
+                                                 "Moving partitions locks receipt lookups; run in a maintenance window.")
+    parser.add_argument('--before', type=int,
+                        default=datetime.date.today().year - Config.ARCHIVE_AFTER_YEARS + 1,
+                        help="Archive every yearly partition older than this year")
+    parser.add_argument('--tablespace', default=Config.ARCHIVE_TABLESPACE,
+                        help="Tablespace for archived partitions (default: ARCHIVE_TABLESPACE)")
+    args = parser.parse_args()
+
+    os.makedirs(Config.ARCHIVE_FOLDER, exist_ok=True)
+
+    # Make sure this and next year's partitions exist, and give every year
+    # found in the default partition (e.g. receipts dated before the first
+    # yearly partition) its own partition so it can be archived like the rest.
+    # Rows already in the default partition are moved into the new ones.
+    this_year = datetime.date.today().year
+    years = sorted({this_year, this_year + 1, *models.get_default_partition_years()})
+    for year in years:
+        try:
+            models.create_receipt_partitions(year, year)
+        except psycopg2.Error as e:
+            logger.error(f"Could not create receipt partitions for {year}: {e}")
+
+    for partition in models.get_receipt_partitions():
+        match = PARTITION_YEAR.match(partition['name'])
+        if not match or int(match.group(1)) >= args.before:
+            continue
+        year = int(match.group(1))
+        tablespace = args.tablespace
+        if tablespace and partition['tablespace'] == tablespace:
+            logger.info(f"Partitions for {year} already in tablespace {tablespace}")
+            tablespace = None
+        archive_year(year, tablespace)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import urllib.request
+import brotli
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_FOLDER = os.path.join(BASE_DIR, 'templates')
+STATIC_FOLDER = os.path.join(BASE_DIR, 'static')
+ASSET_FOLDER = os.path.join(STATIC_FOLDER, 'dist')
+MANIFEST_PATH = os.path.join(ASSET_FOLDER, 'manifest.json')
+
+TAILWIND_URL = 'https://cdn.jsdelivr.net/npm/tailwindcss@2.2.19/dist/tailwind.min.css'
+TAILWIND_PATH = os.path.join(STATIC_FOLDER, 'vendor', 'tailwind-2.2.19.min.css')
+# Subresource integrity hash of tailwind.min.css 2.2.19, as published on cdnjs
+TAILWIND_INTEGRITY = 'sha512-wnea99uKIC3TJF7v4eKk4Y+lMz2Mklv18+r4na2Gn1abDRPPOeef95xTzdwGD9e6zXJBteMIhZ1+68QC5byJZw=='
+DOWNLOAD_TIMEOUT = 30
+
+# Stylesheets concatenated into css/app.css, in cascade order
+CSS_BUNDLE = ['vendor/tailwind-2.2.19.min.css', 'css/styles.css']
+
+CLASS_NAME = re.compile(r'\.((?:\\[0-9a-fA-F]{1,6} ?|\\.|[\w-])+)')
+CSS_ESCAPE = re.compile(r'\\(?:([0-9a-fA-F]{1,6}) ?|(.))', re.S)
+TEMPLATE_TOKEN = re.compile(r'[^<>"\'`\s=]+')
+COMMENT = re.compile(r'/\*.*?\*/', re.S)
+# /*! ... */ comments carry license notices that must stay in the bundle
+LICENSE_COMMENT = re.compile(r'/\*!.*?\*/', re.S)
+
+def template_tokens():
+    # Every whitespace/quote separated token in the templates, in the same
+    # spirit as Tailwind's own purge extractor
+    tokens = set()
+    for root, _, files in os.walk(TEMPLATE_FOLDER):
+        for name in files:
+            with open(os.path.join(root, name), encoding='utf-8') as f:
+                tokens.update(TEMPLATE_TOKEN.findall(f.read()))
+    return tokens
+
+def split_blocks(css):
+    # Yields (prelude, body) for each top level statement; body is None for
+    # statements without a block such as @charset or @import
+    i = 0
+    while i < len(css):
+        start = i
+        while i < len(css) and css[i] not in '{;':
+            i += 1
+        prelude = css[start:i].strip()
+        if i == len(css):
+            if prelude:
+                yield prelude, None
+            return
+        if css[i] == ';':
+            yield prelude, None
+            i += 1
+            continue
+        depth, quote, i = 1, None, i + 1
+        body_start = i
+        while i < len(css) and depth:
+            char = css[i]
+            if quote:
+                if char == '\\':
+                    i += 1
+                elif char == quote:
+                    quote = None
+            elif char in '"\'':
+                quote = char
+            elif char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+            i += 1
+        yield prelude, css[body_start:i - 1]
+
+def css_unescape(name):
+    # Hex escapes such as the \32 in Tailwind's .\32xl\:flex, then \x escapes
+    return CSS_ESCAPE.sub(lambda m: chr(int(m.group(1), 16)) if m.group(1) else m.group(2), name)
+
+def selector_used(selector, used):
+    return all(css_unescape(name) in used for name in CLASS_NAME.findall(selector))
+
+def purge_css(css, used):
+    output = []
+    for prelude, body in split_blocks(COMMENT.sub('', css)):
+        if body is None:
+            output.append(prelude + ';')
+        elif prelude.startswith('@'):
+            if prelude.startswith(('@media', '@supports')):
+                body = purge_css(body, used)
+            if body.strip():
+                output.append(prelude + '{' + body + '}')
+        else:
+            selectors = [s.strip() for s in prelude.split(',') if selector_used(s, used)]
+            if selectors:
+                output.append(','.join(selectors) + '{' + ' '.join(body.split()) + '}')
+    return ''.join(output)
+
+def integrity(data):
+    return 'sha512-' + base64.b64encode(hashlib.sha512(data).digest()).decode('ascii')
+
+def fetch_tailwind(url):
+    # Cached under static/vendor; url may also be a file:// path or an
+    # internal mirror for builds without internet access. Both the download
+    # and the cached copy must match the pinned hash, since the result ends
+    # up in a file that browsers cache for a year.
+    if os.path.exists(TAILWIND_PATH):
+        with open(TAILWIND_PATH, 'rb') as f:
+            if integrity(f.read()) == TAILWIND_INTEGRITY:
+                return
+        logger.warning(f"{TAILWIND_PATH} does not match the pinned hash, downloading again")
+    logger.info(f"Downloading {url}")
+    with urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT) as response:
+        data = response.read()
+    if integrity(data) != TAILWIND_INTEGRITY:
+        raise ValueError(f"{url} does not match the pinned Tailwind 2.2.19 hash {TAILWIND_INTEGRITY}")
+    os.makedirs(os.path.dirname(TAILWIND_PATH), exist_ok=True)
+    with open(TAILWIND_PATH, 'wb') as f:
+        f.write(data)
+
+def write_asset(logical_name, content):
+    # Writes content under a content-hashed name together with its gzip and
+    # brotli variants and returns the hashed name
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    stem, ext = os.path.splitext(logical_name)
+    hashed_name = f"{stem}.{digest}{ext}"
+    path = os.path.join(ASSET_FOLDER, hashed_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(content, compresslevel=9, mtime=0))
+    with open(path + '.br', 'wb') as f:
+        f.write(brotli.compress(content, quality=11))
+    logger.info(f"Wrote {hashed_name} ({len(content)} bytes)")
+    return hashed_name
+
+def build(tailwind_url):
+    fetch_tailwind(tailwind_url)
+    used = template_tokens()
+    parts = []
+    for name in CSS_BUNDLE:
+        with open(os.path.join(STATIC_FOLDER, name), encoding='utf-8') as f:
+            css = f.read()
+        parts.extend(notice + '\n' for notice in LICENSE_COMMENT.findall(css))
+        parts.append(purge_css(css, used) + '\n')
+    manifest = {'css/app.css': write_asset('css/app.css', ''.join(parts).encode('utf-8'))}
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Wrote {MANIFEST_PATH}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Purge, bundle, fingerprint and precompress static assets.")
+    parser.add_argument('--tailwind-url', default=TAILWIND_URL,
+                        help="Where to fetch Tailwind from if it is not yet in static/vendor")
+    args = parser.parse_args()
+    build(args.tailwind_url)
+
+if __name__ == '__main__':
+    main()
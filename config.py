@@ -25,6 +25,13 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB max upload size
 
+    # Archival settings: receipts older than ARCHIVE_AFTER_YEARS have their
+    # partitions moved to ARCHIVE_TABLESPACE (if set) and their files gzipped
+    # into ARCHIVE_FOLDER
+    ARCHIVE_FOLDER = os.getenv('ARCHIVE_FOLDER', os.path.join(os.getcwd(), 'archive'))
+    ARCHIVE_TABLESPACE = os.getenv('ARCHIVE_TABLESPACE')
+    ARCHIVE_AFTER_YEARS = int(os.getenv('ARCHIVE_AFTER_YEARS', 3))
+
     @staticmethod
     def init_app(app):
         pass
\ No newline at end of file
@@ -0,0 +1,239 @@
+import argparse
+import gzip
+import hashlib
+import io
+import logging
+import os
+from PIL import Image
+import models
+from config import Config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Maximum Hamming distance between two 64-bit image hashes that still counts
+# as the same receipt (rescaled, recompressed or re-photographed)
+IMAGE_HASH_DISTANCE = 6
+
+def file_hash(stream):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(64 * 1024), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def image_hash(stream):
+    # Difference hash: 1 bit per horizontally adjacent pixel pair of a 9x8
+    # grayscale thumbnail. Returns None for PDFs and other non-images.
+    try:
+        with Image.open(stream) as img:
+            pixels = list(img.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning(f"Could not compute image hash: {e}")
+        return None
+    finally:
+        stream.seek(0)
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    # Store as a signed BIGINT
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def hamming_distance(a, b):
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count('1')
+
+class BKTree:
+    # Burkhard-Keller tree over image hashes. Each node is
+    # [hash, receipt_ids, {distance: child}], so a lookup only descends into
+    # children whose edge distance is within the search radius.
+    def __init__(self):
+        self.root = None
+        self.hashes = {}
+
+    def add(self, value, receipt_id):
+        if receipt_id in self.hashes:
+            return
+        self.hashes[receipt_id] = value
+        if self.root is None:
+            self.root = [value, [receipt_id], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(receipt_id)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [receipt_id], {}]
+                return
+            node = child
+
+    def remove(self, receipt_id):
+        # The node itself stays in place to keep routing to its children
+        value = self.hashes.pop(receipt_id, None)
+        node = self.root
+        while value is not None and node is not None:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].remove(receipt_id)
+                return
+            node = node[2].get(distance)
+
+    def search(self, value, radius):
+        matches = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= radius:
+                matches.extend(node[1])
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return matches
+
+# Per-user image hash indexes as {user_id: [BKTree, version, epoch]}, checked
+# against the users.image_hash_version/image_hash_epoch markers on every
+# lookup. A newer version only loads the receipts hashed since then; a new
+# epoch means receipts were deleted elsewhere and the tree is rebuilt.
+_image_indexes = {}
+
+def get_image_index(user_id):
+    markers = models.get_image_hash_markers(user_id)
+    version, epoch = markers['image_hash_version'], markers['image_hash_epoch']
+    cached = _image_indexes.get(user_id)
+    if cached is None or cached[2] != epoch:
+        cached = [BKTree(), 0, epoch]
+        _image_indexes[user_id] = cached
+    if cached[1] < version:
+        for row in models.get_user_image_hashes(user_id, cached[1]):
+            cached[0].add(row['image_hash'], row['id'])
+        cached[1] = version
+    return cached[0]
+
+def add_to_image_index(user_id, receipt_id, hash_value):
+    # The version is left alone; the next lookup loads this receipt again,
+    # which the tree ignores
+    cached = _image_indexes.get(user_id)
+    if hash_value is not None and cached is not None:
+        cached[0].add(hash_value, receipt_id)
+
+def remove_from_image_index(user_id, receipt_id):
+    # delete_receipt bumped the epoch by one; following it keeps the tree
+    # unless another worker deleted something in the meantime
+    cached = _image_indexes.get(user_id)
+    if cached is not None and receipt_id in cached[0].hashes:
+        cached[0].remove(receipt_id)
+        cached[2] += 1
+
+def find_duplicates(user_id, content_hash, hash_value, amount, receipt_date, vendor_id):
+    # Returns {receipt_id: reason} for the user's receipts that look like the
+    # upload, strongest reason first
+    duplicates = {}
+    for row in models.get_receipts_by_file_hash(user_id, content_hash):
+        duplicates.setdefault(row['id'], 'identical file')
+    if hash_value is not None:
+        for receipt_id in get_image_index(user_id).search(hash_value, IMAGE_HASH_DISTANCE):
+            duplicates.setdefault(receipt_id, 'similar image')
+    for row in models.get_receipts_by_details(user_id, amount, receipt_date, vendor_id):
+        duplicates.setdefault(row['id'], 'same amount, date and vendor')
+    return duplicates
+
+def open_receipt_file(filename):
+    path = os.path.join(Config.UPLOAD_FOLDER, filename)
+    if os.path.exists(path):
+        return open(path, 'rb')
+    archived = os.path.join(Config.ARCHIVE_FOLDER, filename + '.gz')
+    if os.path.exists(archived):
+        with gzip.open(archived, 'rb') as f:
+            return io.BytesIO(f.read())
+    return None
+
+# Remove a receipt file from uploads and the archive once no receipt uses it
+def delete_receipt_file(filename):
+    if models.count_receipts_by_filename(filename):
+        return
+    for path in (os.path.join(Config.UPLOAD_FOLDER, filename),
+                 os.path.join(Config.ARCHIVE_FOLDER, filename + '.gz')):
+        if os.path.exists(path):
+            os.remove(path)
+            logger.info(f"Removed unreferenced file {path}")
+
+def is_safe_to_delete(copy, original):
+    # Receipts the user saved despite the duplicate warning are kept. Uploads
+    # from before content-addressed filenames overwrote same-named files, so
+    # for those a shared filename only proves a duplicate if the details
+    # match too.
+    if copy['duplicate_confirmed']:
+        return False
+    return copy['filename'] != original['filename'] or (
+        copy['amount'] == original['amount'] and copy['receipt_date'] == original['receipt_date'])
+
+def backfill_hashes():
+    updated = 0
+    for row in models.get_receipts_without_hashes():
+        try:
+            stream = open_receipt_file(row['filename'])
+            if stream is None:
+                logger.warning(f"File {row['filename']} for receipt {row['id']} not found")
+                continue
+            with stream:
+                models.update_receipt_hashes(row['id'], file_hash(stream), image_hash(stream))
+            updated += 1
+        except Exception as e:
+            logger.error(f"Error computing hashes for receipt {row['id']}: {e}")
+    logger.info(f"Computed hashes for {updated} receipts")
+
+def report_similar_images():
+    # Report-only pass: each receipt is compared with the same user's older
+    # receipts through a per-user BK-tree. Byte-identical files are already
+    # covered by the file hash groups and are skipped here.
+    user_id, index, file_hashes = None, None, {}
+    for row in models.get_all_image_hashes():
+        if row['user_id'] != user_id:
+            user_id, index, file_hashes = row['user_id'], BKTree(), {}
+        similar = [receipt_id for receipt_id in index.search(row['image_hash'], IMAGE_HASH_DISTANCE)
+                   if file_hashes[receipt_id] != row['file_hash']]
+        if similar:
+            logger.info(f"User {user_id}: receipt {row['id']} looks similar to receipts {similar} (image)")
+        index.add(row['image_hash'], row['id'])
+        file_hashes[row['id']] = row['file_hash']
+
+def main():
+    parser = argparse.ArgumentParser(description="Find and remove duplicate receipts.")
+    parser.add_argument('--backfill', action='store_true',
+                        help="Compute file and image hashes for receipts that do not have them yet")
+    parser.add_argument('--delete', action='store_true',
+                        help="Delete receipts whose file is identical to an older receipt, "
+                             "unless saved on purpose or the match is uncertain")
+    args = parser.parse_args()
+
+    if args.backfill:
+        backfill_hashes()
+
+    deleted = 0
+    for group in models.get_duplicate_receipt_groups():
+        original, *copies = group['receipt_ids']
+        logger.info(f"User {group['user_id']}: receipts {copies} duplicate receipt {original} ({group['reason']})")
+        # Only byte-identical files are removed automatically; matching
+        # amount/date/vendor may still be two genuine purchases
+        if args.delete and group['reason'] == 'file':
+            receipts = models.get_receipts_for_duplicate_check(group['receipt_ids'])
+            for receipt_id in copies:
+                copy = receipts[receipt_id]
+                if not is_safe_to_delete(copy, receipts[original]):
+                    logger.info(f"Keeping receipt {receipt_id}")
+                    continue
+                if models.delete_receipt(receipt_id):
+                    deleted += 1
+                    delete_receipt_file(copy['filename'])
+    if args.delete:
+        logger.info(f"Deleted {deleted} duplicate receipts")
+
+    report_similar_images()
+
+if __name__ == '__main__':
+    main()
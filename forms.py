@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, DecimalField, DateField, FileField, SelectField, SelectMultipleField, TextAreaField
+from wtforms import StringField, PasswordField, DecimalField, DateField, FileField, SelectField, SelectMultipleField, TextAreaField, BooleanField
 from wtforms.validators import DataRequired, Length, EqualTo, NumberRange, Optional
 from flask_wtf.file import FileRequired, FileAllowed
 
@@ -29,6 +29,7 @@ class ReceiptForm(FlaskForm):
     vendor = SelectField('Vendor', coerce=int)
     payment_method = SelectField('Payment Method', coerce=int, validators=[DataRequired()])
     tags = SelectMultipleField('Tags', coerce=int)
+    allow_duplicate = BooleanField('Upload anyway')
 
 class CategoryForm(FlaskForm):
     name = StringField('Category Name', validators=[DataRequired(), Length(max=100)])
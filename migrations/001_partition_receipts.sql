@@ -0,0 +1,151 @@
+-- Migrates an existing database from the single-table receipts layout to the
+-- range partitioned layout defined in schema.sql (PostgreSQL 15+).
+--
+--     psql -U your_database_username -d your_database_name -f migrations/001_partition_receipts.sql
+--
+-- Runs in one transaction; the old tables are kept as *_unpartitioned until
+-- the copy has been verified and they are dropped by hand.
+
+BEGIN;
+
+ALTER TABLE receipt_items RENAME TO receipt_items_unpartitioned;
+ALTER TABLE receipt_tags RENAME TO receipt_tags_unpartitioned;
+ALTER TABLE receipts RENAME TO receipts_unpartitioned;
+
+-- Keep the existing id sequences so new ids continue where the old ones left off
+ALTER SEQUENCE receipts_id_seq OWNED BY NONE;
+ALTER SEQUENCE receipt_items_id_seq OWNED BY NONE;
+
+ALTER TABLE receipts_unpartitioned RENAME CONSTRAINT receipts_pkey TO receipts_unpartitioned_pkey;
+ALTER TABLE receipt_tags_unpartitioned RENAME CONSTRAINT receipt_tags_pkey TO receipt_tags_unpartitioned_pkey;
+ALTER TABLE receipt_items_unpartitioned RENAME CONSTRAINT receipt_items_pkey TO receipt_items_unpartitioned_pkey;
+
+CREATE TABLE receipts (
+    id INTEGER NOT NULL DEFAULT nextval('receipts_id_seq'),
+    filename VARCHAR(255) NOT NULL,
+    description TEXT,
+    amount NUMERIC(10, 2) NOT NULL,
+    receipt_date DATE NOT NULL,
+    upload_date TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    category_id INTEGER REFERENCES categories(id) ON DELETE SET NULL,
+    vendor_id INTEGER REFERENCES vendors(id) ON DELETE SET NULL,
+    payment_method_id INTEGER REFERENCES payment_methods(id) ON DELETE SET NULL,
+    PRIMARY KEY (id, receipt_date)
+) PARTITION BY RANGE (receipt_date);
+
+CREATE INDEX receipts_id_idx ON receipts (id);
+CREATE INDEX receipts_user_date_idx ON receipts (user_id, receipt_date);
+
+CREATE TABLE receipt_tags (
+    receipt_id INTEGER NOT NULL,
+    receipt_date DATE NOT NULL,
+    tag_id INTEGER REFERENCES tags(id) ON DELETE CASCADE,
+    PRIMARY KEY (receipt_id, receipt_date, tag_id),
+    FOREIGN KEY (receipt_id, receipt_date) REFERENCES receipts(id, receipt_date)
+        ON DELETE CASCADE ON UPDATE CASCADE
+) PARTITION BY RANGE (receipt_date);
+
+CREATE TABLE receipt_items (
+    id INTEGER NOT NULL DEFAULT nextval('receipt_items_id_seq'),
+    receipt_id INTEGER NOT NULL,
+    receipt_date DATE NOT NULL,
+    item_name VARCHAR(100) NOT NULL,
+    quantity INTEGER NOT NULL,
+    price NUMERIC(10, 2) NOT NULL,
+    PRIMARY KEY (id, receipt_date),
+    FOREIGN KEY (receipt_id, receipt_date) REFERENCES receipts(id, receipt_date)
+        ON DELETE CASCADE ON UPDATE CASCADE
+) PARTITION BY RANGE (receipt_date);
+
+CREATE INDEX receipt_items_receipt_idx ON receipt_items (receipt_id);
+
+ALTER SEQUENCE receipts_id_seq OWNED BY receipts.id;
+ALTER SEQUENCE receipt_items_id_seq OWNED BY receipt_items.id;
+
+-- Creates the yearly partitions of receipts, receipt_tags and receipt_items
+-- for every year in [from_year, to_year]. Safe to run repeatedly. Rows that
+-- already landed in the default partitions for a missing year are moved into
+-- the new partitions, since a partition cannot be created while the default
+-- partition holds rows in its range.
+CREATE OR REPLACE FUNCTION create_receipt_partitions(from_year INTEGER, to_year INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    year INTEGER;
+    tbl TEXT;
+    range_start DATE;
+    range_end DATE;
+    has_default BOOLEAN := to_regclass('receipts_default') IS NOT NULL;
+BEGIN
+    FOR year IN from_year..to_year LOOP
+        CONTINUE WHEN to_regclass('receipts_y' || year) IS NOT NULL;
+        range_start := make_date(year, 1, 1);
+        range_end := make_date(year + 1, 1, 1);
+
+        IF has_default THEN
+            CREATE TEMP TABLE moved_receipts AS
+                SELECT * FROM receipts_default WHERE receipt_date >= range_start AND receipt_date < range_end;
+            CREATE TEMP TABLE moved_receipt_tags AS
+                SELECT * FROM receipt_tags_default WHERE receipt_date >= range_start AND receipt_date < range_end;
+            CREATE TEMP TABLE moved_receipt_items AS
+                SELECT * FROM receipt_items_default WHERE receipt_date >= range_start AND receipt_date < range_end;
+            -- Cascades to the receipt_tags and receipt_items default partitions
+            DELETE FROM receipts_default WHERE receipt_date >= range_start AND receipt_date < range_end;
+        END IF;
+
+        FOREACH tbl IN ARRAY ARRAY['receipts', 'receipt_tags', 'receipt_items'] LOOP
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                tbl || '_y' || year, tbl, range_start, range_end
+            );
+        END LOOP;
+
+        IF has_default THEN
+            INSERT INTO receipts SELECT * FROM moved_receipts;
+            INSERT INTO receipt_tags SELECT * FROM moved_receipt_tags;
+            INSERT INTO receipt_items SELECT * FROM moved_receipt_items;
+            DROP TABLE moved_receipts, moved_receipt_tags, moved_receipt_items;
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Cover every year that already has receipts, plus the schema.sql defaults
+SELECT create_receipt_partitions(
+    LEAST(2015, COALESCE(EXTRACT(YEAR FROM MIN(receipt_date))::INTEGER, 2015)),
+    GREATEST(EXTRACT(YEAR FROM CURRENT_DATE)::INTEGER + 1,
+             COALESCE(EXTRACT(YEAR FROM MAX(receipt_date))::INTEGER, 0))
+)
+FROM receipts_unpartitioned;
+
+CREATE TABLE receipts_default PARTITION OF receipts DEFAULT;
+CREATE TABLE receipt_tags_default PARTITION OF receipt_tags DEFAULT;
+CREATE TABLE receipt_items_default PARTITION OF receipt_items DEFAULT;
+
+INSERT INTO receipts (id, filename, description, amount, receipt_date, upload_date,
+                      user_id, category_id, vendor_id, payment_method_id)
+SELECT id, filename, description, amount, receipt_date, upload_date,
+       user_id, category_id, vendor_id, payment_method_id
+FROM receipts_unpartitioned;
+
+INSERT INTO receipt_tags (receipt_id, receipt_date, tag_id)
+SELECT rt.receipt_id, r.receipt_date, rt.tag_id
+FROM receipt_tags_unpartitioned rt
+JOIN receipts_unpartitioned r ON r.id = rt.receipt_id;
+
+INSERT INTO receipt_items (id, receipt_id, receipt_date, item_name, quantity, price)
+SELECT ri.id, ri.receipt_id, r.receipt_date, ri.item_name, ri.quantity, ri.price
+FROM receipt_items_unpartitioned ri
+JOIN receipts_unpartitioned r ON r.id = ri.receipt_id;
+
+SELECT setval('receipts_id_seq', COALESCE((SELECT MAX(id) FROM receipts), 0) + 1, false);
+SELECT setval('receipt_items_id_seq', COALESCE((SELECT MAX(id) FROM receipt_items), 0) + 1, false);
+
+COMMIT;
+
+ANALYZE receipts;
+ANALYZE receipt_tags;
+ANALYZE receipt_items;
+
+-- After checking the row counts match:
+--     DROP TABLE receipt_items_unpartitioned, receipt_tags_unpartitioned, receipts_unpartitioned;
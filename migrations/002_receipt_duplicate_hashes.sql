@@ -0,0 +1,20 @@
+-- Adds the columns and indexes used for duplicate receipt detection.
+--
+--     psql -U your_database_username -d your_database_name -f migrations/002_receipt_duplicate_hashes.sql
+--
+-- Existing receipts get their hashes with: python duplicates.py --backfill
+
+BEGIN;
+
+ALTER TABLE receipts ADD COLUMN IF NOT EXISTS file_hash CHAR(64);
+ALTER TABLE receipts ADD COLUMN IF NOT EXISTS image_hash BIGINT;
+ALTER TABLE receipts ADD COLUMN IF NOT EXISTS image_hash_version INTEGER;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS image_hash_version INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS image_hash_epoch INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE receipts ADD COLUMN IF NOT EXISTS duplicate_confirmed BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE INDEX IF NOT EXISTS receipts_user_file_hash_idx ON receipts (user_id, file_hash);
+CREATE INDEX IF NOT EXISTS receipts_duplicate_idx ON receipts (user_id, amount, receipt_date, vendor_id);
+CREATE INDEX IF NOT EXISTS receipts_user_image_hash_idx ON receipts (user_id, image_hash_version) WHERE image_hash IS NOT NULL;
+
+COMMIT;
@@ -1,6 +1,6 @@
 import psycopg2
 from psycopg2.extras import DictCursor
-from psycopg2 import pool
+from psycopg2 import pool, sql
 import logging
 from config import Config
 from flask_login import UserMixin
@@ -129,15 +129,113 @@ def get_receipt_by_id(receipt_id):
     result = execute_query(query, (receipt_id,))
     return result[0] if result else None
 
-def create_receipt(filename, description, amount, receipt_date, user_id, category_id, vendor_id, payment_method_id):
+def create_receipt(filename, description, amount, receipt_date, user_id, category_id, vendor_id, payment_method_id,
+                   file_hash=None, image_hash=None, duplicate_confirmed=False):
+    # Bumps the user's image hash version in the same statement, so other
+    # workers notice the new hash without scanning the receipts
     query = """
-    INSERT INTO receipts (filename, description, amount, receipt_date, user_id, category_id, vendor_id, payment_method_id)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    WITH version AS (
+        UPDATE users SET image_hash_version = image_hash_version + 1
+        WHERE id = %s AND %s IS NOT NULL
+        RETURNING image_hash_version
+    )
+    INSERT INTO receipts (filename, description, amount, receipt_date, user_id, category_id, vendor_id, payment_method_id,
+                          file_hash, image_hash, image_hash_version, duplicate_confirmed)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, (SELECT image_hash_version FROM version), %s)
     RETURNING id
     """
-    result = execute_query(query, (filename, description, amount, receipt_date, user_id, category_id, vendor_id, payment_method_id))
+    result = execute_query(query, (user_id, image_hash,
+                                   filename, description, amount, receipt_date, user_id, category_id, vendor_id, payment_method_id,
+                                   file_hash, image_hash, duplicate_confirmed))
     return result['id'] if result else None
 
+def get_receipts_by_file_hash(user_id, file_hash):
+    query = """
+    SELECT id, filename, receipt_date, amount
+    FROM receipts
+    WHERE user_id = %s AND file_hash = %s
+    ORDER BY id
+    """
+    return execute_query(query, (user_id, file_hash))
+
+def get_receipts_by_details(user_id, amount, receipt_date, vendor_id):
+    query = """
+    SELECT id, filename, receipt_date, amount
+    FROM receipts
+    WHERE user_id = %s AND amount = %s AND receipt_date = %s AND vendor_id IS NOT DISTINCT FROM %s
+    ORDER BY id
+    """
+    return execute_query(query, (user_id, amount, receipt_date, vendor_id))
+
+def get_user_image_hashes(user_id, since_version=0):
+    query = """
+    SELECT id, image_hash
+    FROM receipts
+    WHERE user_id = %s AND image_hash IS NOT NULL AND image_hash_version > %s
+    """
+    return execute_query(query, (user_id, since_version))
+
+def get_all_image_hashes():
+    query = """
+    SELECT id, user_id, image_hash, file_hash
+    FROM receipts
+    WHERE image_hash IS NOT NULL
+    ORDER BY user_id, upload_date, id
+    """
+    return execute_query(query)
+
+def get_image_hash_markers(user_id):
+    query = "SELECT image_hash_version, image_hash_epoch FROM users WHERE id = %s"
+    result = execute_query(query, (user_id,))
+    return result[0] if result else None
+
+def get_receipts_without_hashes():
+    query = "SELECT id, filename FROM receipts WHERE file_hash IS NULL ORDER BY id"
+    return execute_query(query)
+
+def update_receipt_hashes(receipt_id, file_hash, image_hash):
+    query = """
+    WITH version AS (
+        UPDATE users SET image_hash_version = image_hash_version + 1
+        WHERE id = (SELECT user_id FROM receipts WHERE id = %s) AND %s IS NOT NULL
+        RETURNING image_hash_version
+    )
+    UPDATE receipts
+    SET file_hash = %s, image_hash = %s, image_hash_version = (SELECT image_hash_version FROM version)
+    WHERE id = %s
+    RETURNING id
+    """
+    execute_query(query, (receipt_id, image_hash, file_hash, image_hash, receipt_id))
+
+def get_receipts_for_duplicate_check(receipt_ids):
+    query = """
+    SELECT id, filename, amount, receipt_date, duplicate_confirmed
+    FROM receipts
+    WHERE id = ANY(%s)
+    """
+    return {row['id']: row for row in execute_query(query, (list(receipt_ids),))}
+
+def count_receipts_by_filename(filename):
+    query = "SELECT COUNT(*) AS count FROM receipts WHERE filename = %s"
+    return execute_query(query, (filename,))[0]['count']
+
+def get_duplicate_receipt_groups():
+    # Receipts of the same user sharing either the file content or the
+    # amount/date/vendor combination, oldest receipt first in each group
+    query = """
+    SELECT 'file' AS reason, user_id, array_agg(id ORDER BY upload_date, id) AS receipt_ids
+    FROM receipts
+    WHERE file_hash IS NOT NULL
+    GROUP BY user_id, file_hash
+    HAVING COUNT(*) > 1
+    UNION ALL
+    SELECT 'details' AS reason, user_id, array_agg(id ORDER BY upload_date, id) AS receipt_ids
+    FROM receipts
+    GROUP BY user_id, amount, receipt_date, vendor_id
+    HAVING COUNT(*) > 1
+    """
+    return execute_query(query)
+
 def update_receipt(receipt_id, description, amount, receipt_date, category_id, vendor_id, payment_method_id):
     query = """
     UPDATE receipts
@@ -150,7 +248,12 @@ def delete_receipt(receipt_id):
     queries = [
         "DELETE FROM receipt_tags WHERE receipt_id = %s",
         "DELETE FROM receipt_items WHERE receipt_id = %s",
-        "DELETE FROM receipts WHERE id = %s"
+        """
+        WITH deleted AS (DELETE FROM receipts WHERE id = %s RETURNING user_id, image_hash)
+        UPDATE users SET image_hash_epoch = image_hash_epoch + 1
+        WHERE id IN (SELECT user_id FROM deleted WHERE image_hash IS NOT NULL)
+        RETURNING users.id
+        """
     ]
     try:
         for query in queries:
@@ -218,9 +321,12 @@ def delete_vendor(vendor_id):
     return execute_query(query, (vendor_id,))
 
 def add_receipt_tags(receipt_id, tag_ids):
-    query = "INSERT INTO receipt_tags (receipt_id, tag_id) VALUES (%s, %s)"
+    query = """
+    INSERT INTO receipt_tags (receipt_id, receipt_date, tag_id)
+    SELECT id, receipt_date, %s FROM receipts WHERE id = %s
+    """
     for tag_id in tag_ids:
-        execute_query(query, (receipt_id, tag_id))
+        execute_query(query, (tag_id, receipt_id))
 
 def update_receipt_tags(receipt_id, tag_ids):
     conn = get_db_connection()
@@ -230,7 +336,10 @@ def update_receipt_tags(receipt_id, tag_ids):
             cur.execute("DELETE FROM receipt_tags WHERE receipt_id = %s", (receipt_id,))
             # Then, add the new tags
             for tag_id in tag_ids:
-                cur.execute("INSERT INTO receipt_tags (receipt_id, tag_id) VALUES (%s, %s)", (receipt_id, tag_id))
+                cur.execute("""
+                    INSERT INTO receipt_tags (receipt_id, receipt_date, tag_id)
+                    SELECT id, receipt_date, %s FROM receipts WHERE id = %s
+                """, (tag_id, receipt_id))
         conn.commit()
     except psycopg2.Error as e:
         conn.rollback()
@@ -313,5 +422,67 @@ def get_most_used_category(user_id):
     result = execute_query(query, (user_id,))
     return result[0] if result else None
 
+def get_receipt_partitions():
+    query = """
+    SELECT child.relname AS name, COALESCE(ts.spcname, 'pg_default') AS tablespace
+    FROM pg_inherits i
+    JOIN pg_class parent ON i.inhparent = parent.oid
+    JOIN pg_class child ON i.inhrelid = child.oid
+    LEFT JOIN pg_tablespace ts ON child.reltablespace = ts.oid
+    WHERE parent.relname = 'receipts'
+    ORDER BY child.relname
+    """
+    return execute_query(query)
+
+def create_receipt_partitions(from_year, to_year):
+    query = "SELECT create_receipt_partitions(%s, %s)"
+    return execute_query(query, (from_year, to_year))
+
+def get_default_partition_years():
+    query = """
+    SELECT DISTINCT EXTRACT(YEAR FROM receipt_date)::INTEGER AS year
+    FROM receipts_default
+    ORDER BY year
+    """
+    return [row['year'] for row in execute_query(query)]
+
+def get_receipt_filenames_for_year(year):
+    query = """
+    SELECT DISTINCT filename
+    FROM receipts
+    WHERE receipt_date >= make_date(%s, 1, 1) AND receipt_date < make_date(%s + 1, 1, 1)
+    """
+    return [row['filename'] for row in execute_query(query, (year, year))]
+
+def move_receipt_partitions_to_tablespace(year, tablespace):
+    # Moves the receipts, receipt_tags and receipt_items partitions of one year,
+    # including their indexes, in a single transaction. The partitions stay
+    # attached, so every query keeps seeing the archived rows. Each move
+    # rewrites the partition under an ACCESS EXCLUSIVE lock, and lookups by id
+    # alone cannot skip it, so this belongs in a maintenance window.
+    conn = get_db_connection()
+    try:
+        conn.autocommit = False  # Pooled connections come back with autocommit on
+        with conn.cursor() as cur:
+            for table in ('receipts', 'receipt_tags', 'receipt_items'):
+                partition = f"{table}_y{int(year)}"
+                cur.execute(sql.SQL("ALTER TABLE {} SET TABLESPACE {}").format(
+                    sql.Identifier(partition), sql.Identifier(tablespace)))
+                cur.execute("SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = %s::regclass",
+                            (partition,))
+                for (index_name,) in cur.fetchall():
+                    cur.execute(sql.SQL("ALTER INDEX {} SET TABLESPACE {}").format(
+                        sql.SQL(index_name), sql.Identifier(tablespace)))
+        conn.commit()
+        logger.info(f"Moved receipt partitions for {year} to tablespace {tablespace}")
+    except psycopg2.Error as e:
+        conn.rollback()
+        logger.error(f"Error moving receipt partitions for {year}: {e}")
+        raise
+    finally:
+        if not conn.closed:
+            conn.autocommit = True  # Reset autocommit
+        return_db_connection(conn)
+
 # Initialize the database connection pool when this module is imported
 init_db()
\ No newline at end of file
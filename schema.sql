@@ -1,9 +1,17 @@
+-- Requires PostgreSQL 15+: receipts and its child tables are partitioned by
+-- receipt_date, and only 15+ cascades a cross-partition UPDATE as an update
+-- rather than a delete of the referencing receipt_tags/receipt_items rows.
+
 -- Users table
 CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
     username VARCHAR(50) UNIQUE NOT NULL,
     password VARCHAR(255) NOT NULL,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    -- Markers for the in-memory image hash index: the version grows when a
+    -- receipt gets an image hash, the epoch when one is deleted
+    image_hash_version INTEGER NOT NULL DEFAULT 0,
+    image_hash_epoch INTEGER NOT NULL DEFAULT 0
 );
 
 -- Categories table
@@ -29,9 +37,12 @@ CREATE TABLE IF NOT EXISTS payment_methods (
     description TEXT
 );
 
--- Receipts table
+-- Receipts table, range partitioned by receipt_date (one partition per year).
+-- The primary key has to include the partition key, so child tables reference
+-- (id, receipt_date). Requires PostgreSQL 15+ so that moving a receipt to
+-- another year cascades as an UPDATE instead of deleting its tags and items.
 CREATE TABLE IF NOT EXISTS receipts (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     filename VARCHAR(255) NOT NULL,
     description TEXT,
     amount NUMERIC(10, 2) NOT NULL,
@@ -40,8 +51,21 @@ CREATE TABLE IF NOT EXISTS receipts (
     user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
     category_id INTEGER REFERENCES categories(id) ON DELETE SET NULL,
     vendor_id INTEGER REFERENCES vendors(id) ON DELETE SET NULL,
-    payment_method_id INTEGER REFERENCES payment_methods(id) ON DELETE SET NULL
-);
+    payment_method_id INTEGER REFERENCES payment_methods(id) ON DELETE SET NULL,
+    file_hash CHAR(64),   -- SHA-256 of the uploaded file
+    image_hash BIGINT,    -- 64-bit perceptual hash of image uploads
+    image_hash_version INTEGER,  -- users.image_hash_version when image_hash was set
+    duplicate_confirmed BOOLEAN NOT NULL DEFAULT FALSE,  -- saved despite a duplicate warning
+    PRIMARY KEY (id, receipt_date)
+) PARTITION BY RANGE (receipt_date);
+
+CREATE INDEX IF NOT EXISTS receipts_id_idx ON receipts (id);
+CREATE INDEX IF NOT EXISTS receipts_user_date_idx ON receipts (user_id, receipt_date);
+
+-- Duplicate detection lookups
+CREATE INDEX IF NOT EXISTS receipts_user_file_hash_idx ON receipts (user_id, file_hash);
+CREATE INDEX IF NOT EXISTS receipts_duplicate_idx ON receipts (user_id, amount, receipt_date, vendor_id);
+CREATE INDEX IF NOT EXISTS receipts_user_image_hash_idx ON receipts (user_id, image_hash_version) WHERE image_hash IS NOT NULL;
 
 -- Tags table
 CREATE TABLE IF NOT EXISTS tags (
@@ -49,18 +73,81 @@ CREATE TABLE IF NOT EXISTS tags (
     name VARCHAR(50) UNIQUE NOT NULL
 );
 
--- Receipt-Tags junction table
+-- Receipt-Tags junction table, partitioned like receipts
 CREATE TABLE IF NOT EXISTS receipt_tags (
-    receipt_id INTEGER REFERENCES receipts(id) ON DELETE CASCADE,
+    receipt_id INTEGER NOT NULL,
+    receipt_date DATE NOT NULL,
     tag_id INTEGER REFERENCES tags(id) ON DELETE CASCADE,
-    PRIMARY KEY (receipt_id, tag_id)
-);
+    PRIMARY KEY (receipt_id, receipt_date, tag_id),
+    FOREIGN KEY (receipt_id, receipt_date) REFERENCES receipts(id, receipt_date)
+        ON DELETE CASCADE ON UPDATE CASCADE
+) PARTITION BY RANGE (receipt_date);
 
--- Receipt items table
+-- Receipt items table, partitioned like receipts
 CREATE TABLE IF NOT EXISTS receipt_items (
-    id SERIAL PRIMARY KEY,
-    receipt_id INTEGER REFERENCES receipts(id) ON DELETE CASCADE,
+    id SERIAL,
+    receipt_id INTEGER NOT NULL,
+    receipt_date DATE NOT NULL,
     item_name VARCHAR(100) NOT NULL,
     quantity INTEGER NOT NULL,
-    price NUMERIC(10, 2) NOT NULL
-);
\ No newline at end of file
+    price NUMERIC(10, 2) NOT NULL,
+    PRIMARY KEY (id, receipt_date),
+    FOREIGN KEY (receipt_id, receipt_date) REFERENCES receipts(id, receipt_date)
+        ON DELETE CASCADE ON UPDATE CASCADE
+) PARTITION BY RANGE (receipt_date);
+
+CREATE INDEX IF NOT EXISTS receipt_items_receipt_idx ON receipt_items (receipt_id);
+
+-- Creates the yearly partitions of receipts, receipt_tags and receipt_items
+-- for every year in [from_year, to_year]. Safe to run repeatedly. Rows that
+-- already landed in the default partitions for a missing year are moved into
+-- the new partitions, since a partition cannot be created while the default
+-- partition holds rows in its range.
+CREATE OR REPLACE FUNCTION create_receipt_partitions(from_year INTEGER, to_year INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    year INTEGER;
+    tbl TEXT;
+    range_start DATE;
+    range_end DATE;
+    has_default BOOLEAN := to_regclass('receipts_default') IS NOT NULL;
+BEGIN
+    FOR year IN from_year..to_year LOOP
+        CONTINUE WHEN to_regclass('receipts_y' || year) IS NOT NULL;
+        range_start := make_date(year, 1, 1);
+        range_end := make_date(year + 1, 1, 1);
+
+        IF has_default THEN
+            CREATE TEMP TABLE moved_receipts AS
+                SELECT * FROM receipts_default WHERE receipt_date >= range_start AND receipt_date < range_end;
+            CREATE TEMP TABLE moved_receipt_tags AS
+                SELECT * FROM receipt_tags_default WHERE receipt_date >= range_start AND receipt_date < range_end;
+            CREATE TEMP TABLE moved_receipt_items AS
+                SELECT * FROM receipt_items_default WHERE receipt_date >= range_start AND receipt_date < range_end;
+            -- Cascades to the receipt_tags and receipt_items default partitions
+            DELETE FROM receipts_default WHERE receipt_date >= range_start AND receipt_date < range_end;
+        END IF;
+
+        FOREACH tbl IN ARRAY ARRAY['receipts', 'receipt_tags', 'receipt_items'] LOOP
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                tbl || '_y' || year, tbl, range_start, range_end
+            );
+        END LOOP;
+
+        IF has_default THEN
+            INSERT INTO receipts SELECT * FROM moved_receipts;
+            INSERT INTO receipt_tags SELECT * FROM moved_receipt_tags;
+            INSERT INTO receipt_items SELECT * FROM moved_receipt_items;
+            DROP TABLE moved_receipts, moved_receipt_tags, moved_receipt_items;
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_receipt_partitions(2015, EXTRACT(YEAR FROM CURRENT_DATE)::INTEGER + 1);
+
+-- Catch-all partitions for dates outside the yearly ranges
+CREATE TABLE IF NOT EXISTS receipts_default PARTITION OF receipts DEFAULT;
+CREATE TABLE IF NOT EXISTS receipt_tags_default PARTITION OF receipt_tags DEFAULT;
+CREATE TABLE IF NOT EXISTS receipt_items_default PARTITION OF receipt_items DEFAULT;